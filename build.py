@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 """Build and export the arm64 kernel image using the Tahoe container runtime."""
 
+from __future__ import annotations
+
 import argparse
-import json
+import stat
 import subprocess
+import time
 from pathlib import Path
 
 MIN_CPUS = 8
@@ -36,8 +39,18 @@ def start_container_system() -> None:
 
 
 def _json_from_command(cmd):
-    result = run(cmd, capture_output=True)
-    return json.loads(result.stdout)
+    import json
+
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE) as proc:
+        try:
+            data = json.load(proc.stdout)
+        except json.JSONDecodeError as exc:
+            if proc.wait():
+                raise subprocess.CalledProcessError(proc.returncode, cmd) from exc
+            raise
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return data
 
 
 def fetch_builder_resources() -> tuple[int, int]:
@@ -52,10 +65,18 @@ def fetch_builder_resources() -> tuple[int, int]:
     raise RuntimeError("Unable to determine builder resources")
 
 
-def host_limits() -> tuple[int, int]:
-    cpus = int(run(["sysctl", "-n", "hw.ncpu"], capture_output=True).stdout.strip())
-    memory_bytes = int(run(["sysctl", "-n", "hw.memsize"], capture_output=True).stdout.strip())
-    return cpus, memory_bytes
+def start_host_limits_query() -> subprocess.Popen:
+    return subprocess.Popen(["sysctl", "-n", "hw.ncpu", "hw.memsize"], stdout=subprocess.PIPE, text=True)
+
+
+def host_limits(query: subprocess.Popen | None = None) -> tuple[int, int]:
+    if query is None:
+        query = start_host_limits_query()
+    stdout, _ = query.communicate()
+    if query.returncode:
+        raise subprocess.CalledProcessError(query.returncode, query.args, output=stdout)
+    out = stdout.split()
+    return int(out[0]), int(out[1])
 
 
 def format_gib(bytes_value: int) -> str:
@@ -75,7 +96,7 @@ def format_memory_flag(bytes_value: int) -> str:
     return str(bytes_value)
 
 
-def ensure_resources(requirement_disabled: bool) -> None:
+def ensure_resources(requirement_disabled: bool, host_limits_query: subprocess.Popen | None = None) -> None:
     if requirement_disabled:
         return
     try:
@@ -83,7 +104,7 @@ def ensure_resources(requirement_disabled: bool) -> None:
     except RuntimeError as exc:
         raise SystemExit(f"Failed to inspect container resources: {exc}") from exc
 
-    host_cpus, host_memory_bytes = host_limits()
+    host_cpus, host_memory_bytes = host_limits(host_limits_query)
     issues: list[str] = []
 
     if cpus < MIN_CPUS:
@@ -115,6 +136,13 @@ def ensure_resources(requirement_disabled: bool) -> None:
     raise SystemExit("\n".join(messages))
 
 
+def list_artifacts(out_dir: Path) -> None:
+    for entry in sorted(out_dir.iterdir()):
+        st = entry.stat()
+        modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(st.st_mtime))
+        print(f"{stat.filemode(st.st_mode)} {st.st_size:>12} {modified} {entry.name}")
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description=__doc__,
@@ -141,15 +169,18 @@ def parse_args():
 
 def main() -> None:
     args = parse_args()
-    image_tag = "aarch64-fast-kernel"
     kernel_branch = args.kernel_branch
     out_dir = args.output_dir.expanduser()
     host_mount = out_dir if out_dir.is_absolute() else Path.cwd() / out_dir
 
+    # sysctl does not need the container services, so let it run while they start.
+    host_limits_query = None if args.ignore_resource_check else start_host_limits_query()
     start_container_system()
-    ensure_resources(args.ignore_resource_check)
+    ensure_resources(args.ignore_resource_check, host_limits_query)
+
+    out_dir.mkdir(parents=True, exist_ok=True)
 
-    print(f"==> Building image with Tahoe container (kernel {kernel_branch})…")
+    print(f"==> Building kernel with Tahoe container (kernel {kernel_branch}) and exporting to {out_dir}…")
     run(
         [
             "container",
@@ -157,30 +188,15 @@ def main() -> None:
             "--build-arg",
             f"KERNEL_BRANCH={kernel_branch}",
             "--target",
-            "export",
-            "-t",
-            f"{image_tag}:export",
+            "artifacts",
+            "--output",
+            f"type=local,dest={host_mount}",
             ".",
         ]
     )
 
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    print(f"==> Exporting artifacts to {out_dir} via bind mount…")
-    run(
-        [
-            "container",
-            "run",
-            "--rm",
-            "-v",
-            f"{host_mount}:/out",
-            f"{image_tag}:export",
-        ],
-        stdout=subprocess.DEVNULL,
-    )
-
     print("==> Done. Artifacts:")
-    run(["ls", "-al", str(out_dir)])
+    list_artifacts(out_dir)
 
 
 if __name__ == "__main__":
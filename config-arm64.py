@@ -4,18 +4,25 @@
 from __future__ import annotations
 
 import argparse
-import difflib
+import os
+import re
 import sys
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable
-from urllib.request import urlopen
+from typing import Sequence
 
 REPO_ROOT = Path(__file__).resolve().parent
 LOCAL_CONFIG_PATH = REPO_ROOT / "config-arm64"
+UPSTREAM_COMMIT = "51ef9f81fef574bbd815d4f5560157297b0a4067"
 UPSTREAM_URL = (
     "https://raw.githubusercontent.com/apple/containerization/"
-    "51ef9f81fef574bbd815d4f5560157297b0a4067/kernel/config-arm64"
+    f"{UPSTREAM_COMMIT}/kernel/config-arm64"
+)
+# The upstream URL is pinned to a commit, so a cached copy never goes stale.
+UPSTREAM_CACHE_PATH = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    / "kata-landlock"
+    / f"config-arm64-{UPSTREAM_COMMIT}"
 )
 EXPECTED_CONFIG_LSM = (
     "landlock,lockdown,yama,loadpin,safesetid,integrity,bpf,apparmor"
@@ -35,45 +42,85 @@ CONFIG_OVERRIDES: tuple[ConfigOverride, ...] = (
     ConfigOverride("CONFIG_LSM", f'"{EXPECTED_CONFIG_LSM}"'),
 )
 
-
-def fetch_upstream_lines() -> list[str]:
-    with urlopen(UPSTREAM_URL, timeout=30) as response:  # noqa: S310
-        content = response.read().decode("utf-8")
-    return content.splitlines(keepends=True)
-
-
-def _line_matches_key(line: str, key: str) -> bool:
-    return line.startswith(f"{key}=")
-
-
-def _line_disables_key(line: str, key: str) -> bool:
-    return line.startswith(f"# {key} is not set")
+# Matches the whole line that sets or disables any key an override touches,
+# including insert_after anchors, so one scan locates every line of interest.
+_OVERRIDE_KEYS = sorted(
+    {override.key for override in CONFIG_OVERRIDES}
+    | {override.insert_after for override in CONFIG_OVERRIDES if override.insert_after},
+    key=len,
+    reverse=True,
+)
+_OVERRIDE_KEYS_PATTERN = "|".join(map(re.escape, _OVERRIDE_KEYS))
+_OVERRIDE_RE = re.compile(
+    rf"^(?:({_OVERRIDE_KEYS_PATTERN})=|# ({_OVERRIDE_KEYS_PATTERN}) is not set).*\n?",
+    re.MULTILINE,
+)
 
 
-def _ensure_insert_after(lines: list[str], marker: str) -> int:
-    for index, line in enumerate(lines):
-        if line.startswith(marker):
-            return index
-    return len(lines) - 1
+def fetch_upstream_text() -> str:
+    if UPSTREAM_CACHE_PATH.exists():
+        return UPSTREAM_CACHE_PATH.read_text(encoding="utf-8")
 
+    # Imported lazily: urllib.request pulls in http.client and ssl, which a
+    # cache hit or --help never needs.
+    from urllib.request import urlopen
 
-def apply_overrides(lines: list[str]) -> list[str]:
+    with urlopen(UPSTREAM_URL, timeout=30) as response:  # noqa: S310
+        raw = response.read()
+    content = raw.decode("utf-8")
+
+    try:
+        UPSTREAM_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = UPSTREAM_CACHE_PATH.with_suffix(".partial")
+        partial_path.write_bytes(raw)
+        partial_path.replace(UPSTREAM_CACHE_PATH)
+    except OSError as exc:
+        print(f"Unable to cache upstream config at {UPSTREAM_CACHE_PATH}: {exc}", file=sys.stderr)
+    return content
+
+
+def apply_overrides(text: str) -> tuple[str, dict[str, str]]:
+    spans: dict[str, tuple[int, int]] = {}
+    for match in _OVERRIDE_RE.finditer(text):
+        spans.setdefault(match.group(1) or match.group(2), match.span())
+
+    edits: list[tuple[int, int, str]] = []
+    applied: dict[str, str] = {}
     for override in CONFIG_OVERRIDES:
         desired_line = f"{override.key}={override.value}\n"
-        for index, line in enumerate(lines):
-            if _line_matches_key(line, override.key) or _line_disables_key(line, override.key):
-                lines[index] = desired_line
-                break
-        else:
-            insert_at = _ensure_insert_after(lines, override.insert_after or override.key)
-            lines.insert(insert_at + 1, desired_line)
-    return lines
+        applied[override.key] = override.value
+        span = spans.get(override.key)
+        if span is not None:
+            edits.append((span[0], span[1], desired_line))
+            continue
+        anchor = spans.get(override.insert_after or override.key)
+        position = anchor[1] if anchor is not None else len(text)
+        edits.append((position, position, desired_line))
+        # Later overrides anchored on this key land after it at the same offset.
+        spans[override.key] = (position, position)
+
+    # Sorting on (start, end) keeps same-offset insertions in override order
+    # and ahead of a replacement of the line that follows them.
+    pieces: list[str] = []
+    cursor = 0
+    for start, end, replacement in sorted(edits, key=lambda edit: edit[:2]):
+        pieces.append(text[cursor:start])
+        pieces.append(replacement)
+        cursor = end
+    pieces.append(text[cursor:])
+    return "".join(pieces), applied
+
+
+def unified_diff(from_lines: Sequence[str], to_lines: Sequence[str], *, from_label: str, to_label: str) -> str:
+    # SequenceMatcher is quadratic in the worst case; skip it when nothing changed.
+    if from_lines == to_lines:
+        return ""
+
+    import difflib
 
-
-def unified_diff(from_lines: Iterable[str], to_lines: Iterable[str], *, from_label: str, to_label: str) -> str:
     diff = difflib.unified_diff(
-        list(from_lines),
-        list(to_lines),
+        from_lines,
+        to_lines,
         fromfile=from_label,
         tofile=to_label,
     )
@@ -90,31 +137,36 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def enforce_expected_values(lines: list[str]) -> None:
-    for line in lines:
-        if line.startswith("CONFIG_LSM="):
-            if line.rstrip().split("=", maxsplit=1)[1].strip('"') != EXPECTED_CONFIG_LSM:
-                raise SystemExit(
-                    "Derived configuration has unexpected CONFIG_LSM value:"
-                    f" {line.strip()}"
-                )
-            return
-    raise SystemExit("Derived configuration is missing CONFIG_LSM")
+def enforce_expected_values(applied: dict[str, str]) -> None:
+    value = applied.get("CONFIG_LSM")
+    if value is None:
+        raise SystemExit("Derived configuration is missing CONFIG_LSM")
+    if value.strip('"') != EXPECTED_CONFIG_LSM:
+        raise SystemExit(
+            "Derived configuration has unexpected CONFIG_LSM value:"
+            f" CONFIG_LSM={value}"
+        )
 
 
 def main() -> None:
     args = parse_args()
 
-    upstream_lines = fetch_upstream_lines()
-    derived_lines = apply_overrides(list(upstream_lines))
-    enforce_expected_values(derived_lines)
+    upstream_text = fetch_upstream_text()
+    derived_text, applied = apply_overrides(upstream_text)
+    enforce_expected_values(applied)
+    # Line lists are only materialized when a diff actually has to be shown.
+    derived_lines: list[str] | None = None
 
-    upstream_vs_derived = unified_diff(
-        upstream_lines,
-        derived_lines,
-        from_label="upstream/config-arm64",
-        to_label="derived/config-arm64",
-    )
+    if upstream_text == derived_text:
+        upstream_vs_derived = ""
+    else:
+        derived_lines = derived_text.splitlines(keepends=True)
+        upstream_vs_derived = unified_diff(
+            upstream_text.splitlines(keepends=True),
+            derived_lines,
+            from_label="upstream/config-arm64",
+            to_label="derived/config-arm64",
+        )
     if upstream_vs_derived:
         print("==> Diff against upstream:")
         print(upstream_vs_derived, end="")
@@ -124,16 +176,20 @@ def main() -> None:
     if not LOCAL_CONFIG_PATH.exists():
         print(f"Vendored config missing at {LOCAL_CONFIG_PATH}", file=sys.stderr)
         if args.write:
-            LOCAL_CONFIG_PATH.write_text("".join(derived_lines), encoding="utf-8")
+            LOCAL_CONFIG_PATH.write_text(derived_text, encoding="utf-8")
             print(f"Wrote derived configuration to {LOCAL_CONFIG_PATH}")
             return
         raise SystemExit(1)
 
-    current_lines = LOCAL_CONFIG_PATH.read_text(encoding="utf-8").splitlines(keepends=True)
-    if current_lines == derived_lines:
+    current_bytes = LOCAL_CONFIG_PATH.read_bytes()
+    if current_bytes == derived_text.encode("utf-8"):
         print(f"Vendored config matches derived output at {LOCAL_CONFIG_PATH}")
         return
 
+    current_lines = current_bytes.decode("utf-8").splitlines(keepends=True)
+    if derived_lines is None:
+        derived_lines = derived_text.splitlines(keepends=True)
+
     repo_diff = unified_diff(
         current_lines,
         derived_lines,
@@ -144,7 +200,7 @@ def main() -> None:
     print(repo_diff, end="")
 
     if args.write:
-        LOCAL_CONFIG_PATH.write_text("".join(derived_lines), encoding="utf-8")
+        LOCAL_CONFIG_PATH.write_text(derived_text, encoding="utf-8")
         print(f"Updated {LOCAL_CONFIG_PATH} to match derived configuration")
     else:
         raise SystemExit(
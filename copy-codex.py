@@ -7,16 +7,47 @@ import argparse
 import json
 import os
 import shlex
+import shutil
 import stat
 import subprocess
 import sys
-import tarfile
-import tempfile
+import time
+from contextlib import ExitStack, closing, contextmanager
 from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Iterator, NamedTuple
+from urllib.parse import urlsplit
+
+# http.client (which pulls in ssl), tarfile and tempfile are only needed once a
+# download starts. main(), github_get() and prepare_binary() import them so
+# --help and --list-containers stay quick.
+if TYPE_CHECKING:
+    import http.client
+    import tarfile
 
 REPO = "openai/codex"
 ASSET_NAME = "codex-aarch64-unknown-linux-musl.tar.gz"
 DEST_PATH = "/usr/local/bin/codex"
+GITHUB_API_HOST = "api.github.com"
+HTTP_TIMEOUT_SECONDS = 60
+USER_AGENT = "kata-landlock-copy-codex"
+RELEASE_CACHE_PATH = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    / "kata-landlock"
+    / "codex-latest.json"
+)
+RELEASE_CACHE_TTL_SECONDS = 5 * 60
+
+
+class GitHubError(RuntimeError):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+
+
+class ReleaseAsset(NamedTuple):
+    tag_name: str
+    asset_id: int
+    cached: bool = False
 
 
 def format_process_error(prefix: str, exc: subprocess.CalledProcessError) -> str:
@@ -37,41 +68,71 @@ def format_process_error(prefix: str, exc: subprocess.CalledProcessError) -> str
     return message
 
 
-def ensure_authentication() -> None:
-    if os.environ.get("GH_TOKEN"):
-        return
-    command = [
-        "gh",
-        "auth",
-        "status",
-        "--hostname",
-        "github.com",
-    ]
+def github_token() -> str | None:
+    token = os.environ.get("GH_TOKEN")
+    if token:
+        return token
+    # Missing or logged-out gh is not fatal on its own: the repository is
+    # public, and an API call that needs credentials reports it with a 401.
     try:
-        subprocess.run(
-            command,
+        result = subprocess.run(
+            ["gh", "auth", "token", "--hostname", "github.com"],
             check=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.PIPE,
-        )
-    except FileNotFoundError as exc:
-        print(
-            "GitHub CLI ('gh') is not installed or not on PATH. "
-            "Install it from https://cli.github.com/ before running this script.",
-            file=sys.stderr,
-        )
-        sys.exit(exc.errno or 1)
-    except subprocess.CalledProcessError as exc:
-        message = format_process_error(
-            "GitHub CLI is not authenticated for github.com",
-            exc,
+            capture_output=True,
+            text=True,
         )
-        message += (
-            "\nAuthenticate via `gh auth login --hostname github.com` "
-            "or set GH_TOKEN for this session."
-        )
-        print(message, file=sys.stderr)
-        sys.exit(exc.returncode or 1)
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def _error_message(body: bytes) -> str:
+    try:
+        message = json.loads(body).get("message")
+    except (ValueError, AttributeError):
+        message = None
+    return message or body.decode("utf-8", "replace").strip()
+
+
+@contextmanager
+def github_get(
+    connection: http.client.HTTPSConnection,
+    path: str,
+    *,
+    accept: str,
+    token: str | None,
+) -> Iterator[http.client.HTTPResponse]:
+    import http.client
+
+    headers = {"Accept": accept, "User-Agent": USER_AGENT}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    # Protocol errors, including ones raised while the caller reads the body,
+    # are reported as RuntimeError so callers need not import http.client.
+    try:
+        with ExitStack() as stack:
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            if response.status in {301, 302, 303, 307, 308}:
+                location = response.getheader("Location")
+                response.read()
+                if not location:
+                    raise GitHubError(response.status, f"redirect for {path} has no Location")
+                # Asset downloads redirect to a pre-signed URL on another host; the
+                # token must not be forwarded there.
+                url = urlsplit(location)
+                target = f"{url.path}?{url.query}" if url.query else url.path
+                redirected = stack.enter_context(
+                    closing(http.client.HTTPSConnection(url.netloc, timeout=HTTP_TIMEOUT_SECONDS))
+                )
+                redirected.request("GET", target, headers={"Accept": accept, "User-Agent": USER_AGENT})
+                response = redirected.getresponse()
+            stack.enter_context(response)
+            if response.status >= 400:
+                raise GitHubError(response.status, _error_message(response.read()))
+            yield response
+    except http.client.HTTPException as exc:
+        raise RuntimeError(f"Malformed or truncated GitHub response for {path}: {exc!r}") from exc
 
 
 def list_containers() -> None:
@@ -128,37 +189,91 @@ def parse_args() -> argparse.Namespace:
     return args
 
 
-def fetch_latest_asset(asset_name: str) -> tuple[str, dict]:
-    command = [
-        "gh",
-        "api",
-        "-H",
-        "Accept: application/vnd.github+json",
+def _load_release_cache() -> dict | None:
+    try:
+        if time.time() - RELEASE_CACHE_PATH.stat().st_mtime > RELEASE_CACHE_TTL_SECONDS:
+            return None
+        cached = json.loads(RELEASE_CACHE_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or not isinstance(cached.get("assets"), dict):
+        return None
+    return cached
+
+
+def _store_release_cache(tag_name: str, assets: dict[str, int]) -> None:
+    try:
+        RELEASE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = RELEASE_CACHE_PATH.with_suffix(".partial")
+        partial_path.write_text(json.dumps({"tag": tag_name, "assets": assets}), encoding="utf-8")
+        partial_path.replace(RELEASE_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def invalidate_release_cache() -> None:
+    try:
+        RELEASE_CACHE_PATH.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
+def fetch_latest_asset(
+    connection: http.client.HTTPSConnection, token: str | None, asset_name: str
+) -> ReleaseAsset:
+    cached = _load_release_cache()
+    if cached is not None:
+        asset_id = cached["assets"].get(asset_name)
+        if isinstance(asset_id, int):
+            return ReleaseAsset(cached.get("tag", ""), asset_id, cached=True)
+
+    with github_get(
+        connection,
         f"/repos/{REPO}/releases/latest",
-    ]
-    result = subprocess.run(command, check=True, capture_output=True, text=True)
-    release = json.loads(result.stdout)
-    assets = release.get("assets", [])
-    for asset in assets:
-        if asset.get("name") == asset_name:
-            return release.get("tag_name", ""), asset
-    asset_names = ", ".join(asset.get("name", "<unknown>") for asset in assets)
-    raise RuntimeError(
-        f"Asset {asset_name!r} not found in latest release. Available assets: {asset_names}"
+        accept="application/vnd.github+json",
+        token=token,
+    ) as response:
+        release = json.load(response)
+    tag_name = release.get("tag_name", "")
+    assets = {
+        asset.get("name", "<unknown>"): asset.get("id")
+        for asset in release.get("assets", [])
+    }
+    _store_release_cache(
+        tag_name,
+        {name: asset_id for name, asset_id in assets.items() if isinstance(asset_id, int)},
     )
+    if asset_name not in assets:
+        raise RuntimeError(
+            f"Asset {asset_name!r} not found in latest release. Available assets: {', '.join(assets)}"
+        )
+    asset_id = assets[asset_name]
+    if asset_id is None:
+        raise RuntimeError(f"Latest release asset {asset_name!r} is missing an id")
+    return ReleaseAsset(tag_name, int(asset_id), cached=False)
 
 
-def download_asset(asset_id: int, destination: Path) -> None:
-    command = [
-        "gh",
-        "api",
-        "-H",
-        "Accept: application/octet-stream",
-        f"/repos/{REPO}/releases/assets/{asset_id}",
-    ]
-    destination.parent.mkdir(parents=True, exist_ok=True)
-    with destination.open("wb") as stream:
-        subprocess.run(command, check=True, stdout=stream, stderr=subprocess.PIPE)
+def inspect_latest_release(
+    connection: http.client.HTTPSConnection, token: str | None, asset_name: str
+) -> ReleaseAsset:
+    try:
+        return fetch_latest_asset(connection, token, asset_name)
+    except (OSError, ValueError, RuntimeError) as exc:
+        reason = f"Failed to inspect latest release for {REPO}: {exc}"
+        if "saml enforcement" in reason.lower():
+            reason += (
+                "\nRun `gh auth refresh -h github.com -s org:read` (or authorize GH_TOKEN) "
+                "to enable SSO for the OpenAI organization."
+            )
+        elif isinstance(exc, GitHubError) and (
+            exc.status == 401 or (token is None and exc.status == 403)
+        ):
+            reason += (
+                "\nAuthenticate via `gh auth login --hostname github.com` "
+                "(install gh from https://cli.github.com/) or set GH_TOKEN for this session."
+            )
+        print(reason, file=sys.stderr)
+        sys.exit(1)
 
 
 def ensure_executable(target: Path) -> None:
@@ -166,69 +281,94 @@ def ensure_executable(target: Path) -> None:
     target.chmod(current_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
 
 
-def _cleanup_parent_dirs(path: Path, stop_dir: Path) -> None:
-    parent = path
-    while parent != stop_dir and parent.parent != parent:
-        try:
-            parent.rmdir()
-        except OSError:
-            break
-        parent = parent.parent
+def _is_codex_member(entry: tarfile.TarInfo) -> bool:
+    name = Path(entry.name).name
+    return name in {"codex", "codex.exe"} or name.startswith("codex-")
+
+
+def _copy_member(archive: tarfile.TarFile, member: tarfile.TarInfo, target_path: Path) -> None:
+    source = archive.extractfile(member)
+    if source is None:
+        raise RuntimeError(f"Unable to read {member.name!r} from archive")
+    with source, target_path.open("wb") as destination:
+        shutil.copyfileobj(source, destination, length=1 << 20)
 
 
-def prepare_binary(asset_path: Path, asset_name: str) -> Path:
-    workdir = asset_path.parent
+def prepare_binary(source: BinaryIO, asset_name: str, workdir: Path) -> Path:
+    import tarfile
+
     lowered = asset_name.lower()
 
     if lowered.endswith((".tar.gz", ".tgz")):
+        target_path = workdir / "codex"
+        copied = False
         try:
-            with tarfile.open(asset_path, mode="r:gz") as archive:
-                members = [entry for entry in archive.getmembers() if entry.isfile()]
-                member = next(
-                    (
-                        entry
-                        for entry in members
-                        if Path(entry.name).name in {"codex", "codex.exe"}
-                        or Path(entry.name).name.startswith("codex-")
-                    ),
-                    None,
-                )
-                if member is None:
-                    if not members:
-                        raise RuntimeError(
-                            f"Archive {asset_name!r} does not contain any files"
-                        )
-                    member = members[0]
-                archive.extract(member, path=workdir, filter="data")
+            with tarfile.open(fileobj=source, mode="r|gz") as archive:
+                for entry in archive:
+                    if not entry.isfile():
+                        continue
+                    is_codex = _is_codex_member(entry)
+                    if copied and not is_codex:
+                        continue
+                    # A streamed archive cannot be rewound, so the first file is
+                    # kept as a fallback until a codex binary turns up.
+                    _copy_member(archive, entry, target_path)
+                    copied = True
+                    if is_codex:
+                        break
         except (tarfile.TarError, OSError) as exc:
             raise RuntimeError(f"Failed to extract {asset_name}: {exc}") from exc
 
-        extracted_path = workdir / member.name
-        target_path = workdir / "codex"
-        extracted_parent = extracted_path.parent
-        if target_path.exists():
-            target_path.unlink()
-        try:
-            extracted_path.replace(target_path)
-        except OSError:
-            target_path.write_bytes(extracted_path.read_bytes())
-            extracted_path.unlink()
-
-        _cleanup_parent_dirs(extracted_parent, workdir)
-        asset_path.unlink(missing_ok=True)
+        if not copied:
+            raise RuntimeError(f"Archive {asset_name!r} does not contain any files")
         ensure_executable(target_path)
         return target_path
 
-    if lowered.endswith(".zst"):
+    target_path = workdir / asset_name
+    try:
+        with target_path.open("wb") as destination:
+            shutil.copyfileobj(source, destination, length=1 << 20)
+    except OSError as exc:
+        raise RuntimeError(f"Failed to write {asset_name}: {exc}") from exc
+    ensure_executable(target_path)
+    return target_path
+
+
+def download_binary(
+    connection: http.client.HTTPSConnection,
+    token: str | None,
+    asset_id: int,
+    asset_name: str,
+    workdir: Path,
+) -> Path:
+    if asset_name.lower().endswith(".zst"):
         raise RuntimeError(
             f"Unsupported asset compression for {asset_name!r}; use the .tar.gz asset"
         )
 
-    ensure_executable(asset_path)
-    return asset_path
+    workdir.mkdir(parents=True, exist_ok=True)
+    with github_get(
+        connection,
+        f"/repos/{REPO}/releases/assets/{asset_id}",
+        accept="application/octet-stream",
+        token=token,
+    ) as response:
+        return prepare_binary(response, asset_name, workdir)
+
+
+def _container_cp_available() -> bool:
+    # Releases without `cp` hand unknown subcommands to the plugin loader,
+    # which exits non-zero; rely on that status rather than on message text.
+    probe = subprocess.run(
+        ["container", "cp", "--help"],
+        check=False,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return probe.returncode == 0
 
 
-def copy_binary(container_id: str, source_path: Path, destination: str) -> None:
+def _stream_binary(container_id: str, source_path: Path, destination: str) -> None:
     quoted_dest = shlex.quote(destination)
     command = [
         "container",
@@ -237,61 +377,65 @@ def copy_binary(container_id: str, source_path: Path, destination: str) -> None:
         container_id,
         "sh",
         "-c",
-        f"cat > {quoted_dest} && chmod +x {quoted_dest}",
+        f"dd of={quoted_dest} bs=1M && chmod +x {quoted_dest}",
     ]
     with source_path.open("rb") as src:
         subprocess.run(command, stdin=src, check=True, stderr=subprocess.PIPE)
 
 
+def copy_binary(container_id: str, source_path: Path, destination: str) -> None:
+    if not _container_cp_available():
+        _stream_binary(container_id, source_path, destination)
+        return
+    subprocess.run(
+        ["container", "cp", str(source_path), f"{container_id}:{destination}"],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    subprocess.run(
+        ["container", "exec", container_id, "chmod", "+x", destination],
+        check=True,
+        stderr=subprocess.PIPE,
+    )
+
+
 def main() -> None:
     args = parse_args()
     container_id = args.container_id
     asset_name = args.asset_name
     dest_path = args.dest_path
 
-    ensure_authentication()
+    import http.client
+    import tempfile
 
-    try:
-        tag_name, asset = fetch_latest_asset(asset_name)
-    except (subprocess.CalledProcessError, json.JSONDecodeError, RuntimeError) as exc:
-        if isinstance(exc, subprocess.CalledProcessError):
-            reason = format_process_error(
-                f"Failed to inspect latest release for {REPO}",
-                exc,
-            )
-            lower_reason = reason.lower()
-            if "saml enforcement" in lower_reason:
-                reason += (
-                    "\nRun `gh auth refresh -h github.com -s org:read` to enable SSO for "
-                    "the OpenAI organization."
-                )
-            elif "gh auth login" in lower_reason or "get started with github cli" in lower_reason:
-                reason += "\nAuthenticate via `gh auth login --hostname github.com`."
-        else:
-            reason = f"Failed to inspect latest release for {REPO}: {exc}"
-        print(reason, file=sys.stderr)
-        sys.exit(1)
+    token = github_token()
+    connection = http.client.HTTPSConnection(GITHUB_API_HOST, timeout=HTTP_TIMEOUT_SECONDS)
 
-    asset_id = asset.get("id")
-    if asset_id is None:
-        print(f"Latest release asset missing id: {asset}", file=sys.stderr)
-        sys.exit(1)
+    release = inspect_latest_release(connection, token, asset_name)
 
-    with tempfile.TemporaryDirectory(prefix="codex-download-") as tmpdir:
+    with closing(connection), tempfile.TemporaryDirectory(prefix="codex-download-") as tmpdir:
         tmpdir_path = Path(tmpdir)
-        asset_path = tmpdir_path / asset_name
         try:
-            download_asset(int(asset_id), asset_path)
-        except subprocess.CalledProcessError as exc:
-            message = format_process_error(
-                f"Failed to download {asset_name} from release {tag_name}",
-                exc,
+            try:
+                binary_path = download_binary(
+                    connection, token, release.asset_id, asset_name, tmpdir_path
+                )
+            except GitHubError as exc:
+                # A cached asset id can outlive the release it came from.
+                if exc.status != 404 or not release.cached:
+                    raise
+                invalidate_release_cache()
+                release = inspect_latest_release(connection, token, asset_name)
+                binary_path = download_binary(
+                    connection, token, release.asset_id, asset_name, tmpdir_path
+                )
+        except (GitHubError, OSError) as exc:
+            print(
+                f"Failed to download {asset_name} from release {release.tag_name}: {exc}",
+                file=sys.stderr,
             )
-            print(message, file=sys.stderr)
-            sys.exit(exc.returncode)
-
-        try:
-            binary_path = prepare_binary(asset_path, asset_name)
+            sys.exit(1)
         except RuntimeError as exc:
             print(str(exc), file=sys.stderr)
             sys.exit(1)
@@ -304,7 +448,7 @@ def main() -> None:
             sys.exit(1)
 
         print(
-            f"Copying {asset_name} from release {tag_name or '<unknown>'} into {container_id}…",
+            f"Copying {asset_name} from release {release.tag_name or '<unknown>'} into {container_id}…",
             file=sys.stderr,
         )
         try: